@@ -0,0 +1,41 @@
+"""Single HTTP function multiplexing every HTTP operation of the service.
+
+One warm instance serves all HTTP traffic instead of each endpoint paying its own
+cold start. The operation is taken from `?op=` or, if absent, the last path segment:
+
+    /api/send-informative   (op=send-informative)  -> informative email sender
+    /api/verify?token=...   (op=verify)            -> verification link handler
+
+The standalone function names are accepted as aliases, so pointing FUNCTION_BASE_URL
+at `.../api` makes new verification links (`.../api/handle_verification_click`) land
+here. The standalone `send_informative` and `handle_verification_click` functions stay
+deployed until already-sent links have expired and clients have moved to `api`.
+"""
+
+from __future__ import annotations
+
+from firebase_functions.https_fn import on_request, Request, Response
+
+import resend_service
+from informative_http import USE_FIREBASE_SECRETS, send_informative_impl
+from verification import handle_verification_click_impl
+
+_ROUTES = {
+    "send-informative": send_informative_impl,
+    "verify": handle_verification_click_impl,
+    # Aliases matching the standalone function names
+    "send_informative": send_informative_impl,
+    "handle_verification_click": handle_verification_click_impl,
+}
+
+_on_request = on_request(secrets=[resend_service.RESEND_API_KEY]) if USE_FIREBASE_SECRETS else on_request()
+
+
+@_on_request
+def api(req: Request) -> Response:
+    """Dispatches the request to the handler registered for its operation."""
+    op = req.args.get("op") or req.path.rstrip("/").rsplit("/", 1)[-1]
+    handler = _ROUTES.get(op)
+    if handler is None:
+        return "Unknown operation.", 404
+    return handler(req)
@@ -1,17 +1,50 @@
 from __future__ import annotations
 
 import os
-import json
-from typing import Any, Dict, List
+from functools import lru_cache
+from typing import Annotated, Any, Dict, List, Optional, Union
+import orjson
 from firebase_functions.https_fn import on_request, Request, Response
 
 import resend_service
 from informative_email import send_informative_email
 
+DEFAULT_FROM_ADDR = "Finsync <info@finsyncdigitalservice.com>"
+
+
+@lru_cache(maxsize=None)
+def _body_model():
+    """Return the pydantic model for the `send_informative` JSON body, built on first use.
+
+    pydantic is imported here rather than at module level because main.py loads this
+    module for every function, and only this endpoint validates with it.
+    """
+    from pydantic import BaseModel, Field, field_validator
+
+    class SendInformativeBody(BaseModel):
+        """JSON body accepted by `send_informative` (validated by pydantic-core in one pass)."""
+
+        subject: str = Field(min_length=1)
+        body: str = Field(min_length=1)
+        to: List[Annotated[str, Field(min_length=1)]] = Field(min_length=1)
+        from_: Optional[str] = Field(default=None, alias="from")
+        replyTo: Optional[Union[str, List[str]]] = None
+        name: Optional[str] = None
+        logoUrl: Optional[str] = None
+        perRecipient: bool = False
+
+        @field_validator("to", mode="before")
+        @classmethod
+        def _normalize_to(cls, value: Any) -> Any:
+            # Accept a single address as shorthand for a one-item list
+            return [value] if isinstance(value, str) else value
+
+    return SendInformativeBody
+
 
 def _json_response(payload: Dict[str, Any], status: int = 200) -> Response:
     return Response(
-        response=json.dumps(payload),
+        response=orjson.dumps(payload),
         status=status,
         mimetype="application/json",
     )
@@ -27,18 +60,23 @@ _on_request = on_request(secrets=[resend_service.RESEND_API_KEY]) if USE_FIREBAS
 
 @_on_request
 def send_informative(req: Request) -> Response:
-    
-    """HTTP endpoint to send an informative email.
+    """HTTP endpoint to send an informative email (see `send_informative_impl`)."""
+    return send_informative_impl(req)
+
+
+def send_informative_impl(req: Request) -> Response:
+    """Sends an informative email; served by `send_informative` and the multiplexed `api`.
 
     Accepts JSON body:
     {
         "subject": "...",            # required
-        "body": "...",               # required (plain text or simple HTML)
+        "body": "...",               # required (plain text; HTML is escaped)
         "to": "user@example.com" | ["user@example.com", ...],  # required
         "from": "Finsync <info@finsyncdigitalservice.com>",     # optional
-        "replyTo": "support@...",    # optional
+        "replyTo": "support@..." | ["support@...", ...],  # optional
         "name": "Alex",              # optional recipient display name
-        "logoUrl": "https://..."     # optional
+        "logoUrl": "https://...",    # optional
+        "perRecipient": true         # optional; send each address its own copy (one batch request)
     }
     """
 
@@ -50,38 +88,36 @@ def send_informative(req: Request) -> Response:
     except Exception:
         return _json_response({"error": "Invalid JSON."}, status=400)
 
-    subject = data.get("subject")
-    body_text = data.get("body")
-    to_field = data.get("to")
+    body_model = _body_model()
+    from pydantic import ValidationError  # already loaded by _body_model()
 
-    if not subject or not body_text or not to_field:
+    try:
+        parsed = body_model.model_validate(data)
+    except ValidationError as e:
         return _json_response({
-            "error": "Missing required fields: subject, body, to"
+            "error": e.errors(include_url=False, include_context=False, include_input=False)
         }, status=400)
 
-    # Normalize recipients
-    if isinstance(to_field, str):
-        to_list: List[str] = [to_field]
-    elif isinstance(to_field, list) and all(isinstance(x, str) for x in to_field):
-        to_list = to_field
-    else:
-        return _json_response({"error": "'to' must be a string or list of strings."}, status=400)
-
-    from_addr = data.get("from") or "Finsync <info@finsyncdigitalservice.com>"
-    reply_to = data.get("replyTo")
-    recipient_name = data.get("name")
-    logo_url = data.get("logoUrl")
+    to_list: List[str] = parsed.to
 
     try:
         result = send_informative_email(
-            subject=subject,
-            body_text=body_text,
+            subject=parsed.subject,
+            body_text=parsed.body,
             to=to_list,
-            from_addr=from_addr,
-            reply_to=reply_to,
-            recipient_name=recipient_name,
-            logo_url=logo_url,
+            from_addr=parsed.from_ or DEFAULT_FROM_ADDR,
+            reply_to=parsed.replyTo,
+            recipient_name=parsed.name,
+            logo_url=parsed.logoUrl,
+            per_recipient=parsed.perRecipient,
         )
+    except resend_service.BatchSendError as e:
+        # The first `sentCount` recipients already got the email; don't resend to them
+        return _json_response({
+            "error": f"Failed to send: {e}",
+            "sentCount": e.sent_count,
+            "sent": to_list[:e.sent_count],
+        }, status=500)
     except Exception as e:
         return _json_response({"error": f"Failed to send: {e}"}, status=500)
 
@@ -89,6 +125,6 @@ def send_informative(req: Request) -> Response:
     return _json_response({
         "ok": True,
         "to": to_list,
-        "subject": subject,
+        "subject": parsed.subject,
         "providerResponse": str(result),
     }, status=200)
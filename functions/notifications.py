@@ -1,13 +1,238 @@
 import os
-from datetime import datetime
-from firebase_admin import db
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import lru_cache
+from string import Template
 from firebase_functions import db_fn
+from markupsafe import escape
 import resend_service  # local email helper
+from rtdb import users_ref
 
 # Default logo (used if not provided in data/notification/user and no env var)
 DEFAULT_FINSYNC_LOGO_URL = (
     "https://firebasestorage.googleapis.com/v0/b/finsync-8ea36.firebasestorage.app/o/icon-dark.png?alt=media&token=1f1862ab-cee1-4972-950c-b11549096d29"
 )
+
+_DEFAULT_LOGO_URL = os.getenv("FINSYNC_LOGO_URL") or DEFAULT_FINSYNC_LOGO_URL
+
+# Brand blocks; the default logo + bank name variant is prebuilt since it's the common case
+_DEFAULT_BANK_NAME = "Finsync"
+_BRAND_IMG_HTML = '<img src="{logo_url}" alt="{bank_name} logo" width="28" height="28" style="display:block;border:0;border-radius:6px;" />'
+_DEFAULT_BRAND_HTML = _BRAND_IMG_HTML.format(logo_url=escape(_DEFAULT_LOGO_URL), bank_name=_DEFAULT_BANK_NAME)
+_FALLBACK_BRAND_HTML = '<span style="display:inline-block;width:28px;height:28px;background:#ffffff22;border-radius:6px;"></span>'
+
+# Debit Alert HTML, split into a header template, one row template reused for each
+# detail line, and a static footer. All pieces are built once at import.
+_DEBIT_ALERT_HEADER_TPL = Template("""
+                <div style="margin:0;padding:24px;background:#f5f5f5;font-family:Segoe UI, Roboto, Helvetica, Arial, sans-serif;color:#111111;">
+                    <table role="presentation" width="100%" cellspacing="0" cellpadding="0" border="0" style="max-width:620px;margin:0 auto;background:#ffffff;border-radius:12px;box-shadow:0 1px 3px rgba(0,0,0,0.06);overflow:hidden;">
+                        <tr>
+                            <td style="padding:0;background:linear-gradient(135deg,#111111,#333333);">
+                                <table role="presentation" width="100%" cellspacing="0" cellpadding="0" border="0"><tr><td style="padding:24px 28px;color:#ffffff;">
+                                    <table role="presentation" width="100%" cellspacing="0" cellpadding="0" border="0"><tr>
+                                        <td style="font-size:18px;font-weight:600;">
+                                            <table role="presentation" cellspacing="0" cellpadding="0" border="0"><tr>
+                                                <td style="vertical-align:middle;">$brand_html</td>
+                                                <td style="vertical-align:middle;padding-left:10px;text-transform:lowercase;">$bank_name</td>
+                                            </tr></table>
+                                        </td>
+                                        <td style="text-align:right;font-size:18px;font-weight:700;">Debit Alert!</td>
+                                    </tr></table>
+                                </td></tr></table>
+                            </td>
+                        </tr>
+                        <tr>
+                            <td style="padding:28px;">
+                                <p style="margin:0 0 12px 0;font-size:14px;color:#4a5568;">Hi $first_name,</p>
+                                <p style="margin:0 0 18px 0;font-size:14px;color:#4a5568;">We wish to inform you that a transaction occurred on your account with us.</p>
+
+                                <div style="margin:18px 0 22px 0;text-align:center;">
+                                    <div style="font-size:12px;color:#666666;text-transform:uppercase;letter-spacing:0.06em;margin-bottom:6px;">Debit Amount</div>
+                                    <div style="font-size:28px;font-weight:800;color:#111111;">$amount</div>
+                                </div>
+
+                                <table role="presentation" width="100%" cellspacing="0" cellpadding="0" border="0" style="border:1px solid #e5e7eb;border-radius:10px;">""")
+
+_DEBIT_ALERT_ROW_TPL = Template("""
+                                    <tr>
+                                        <td style="$cell_style">
+                                            <div style="font-size:11px;color:#8a94a6;text-transform:uppercase;letter-spacing:0.06em;">$label</div>
+                                            <div style="$value_style">$value</div>
+                                        </td>
+                                    </tr>""")
+
+_DEBIT_ALERT_FOOTER = """
+                                </table>
+
+                                <p style="margin:18px 0 0 0;font-size:12px;color:#6b7280;">If you experience any problems kindly contact us at <a href="mailto:support@finsyncdigitalservice.com" style="color:#111111;text-decoration:none;">support@finsyncdigitalservice.com</a> or send a WhatsApp message at <a style="color:#111111;text-decoration:none;" href="https://wa.me/2348068810033">+234 806 881 0033</a>.</p>
+                            </td>
+                        </tr>
+                        <tr>
+                            <td style="padding:18px 28px;background:#f8fafc;color:#64748b;font-size:11px;text-align:center;">
+                                <div style="margin-bottom:6px;">Follow us on</div>
+                                <div>
+                                    <a href="https://twitter.com" style="color:#111111;text-decoration:none;margin:0 6px;">Twitter</a>
+                                    <a href="https://facebook.com" style="color:#111111;text-decoration:none;margin:0 6px;">Facebook</a>
+                                    <a href="https://instagram.com" style="color:#111111;text-decoration:none;margin:0 6px;">Instagram</a>
+                                </div>
+                            </td>
+                        </tr>
+                    </table>
+                </div>
+        """
+
+_ROW_CELL_STYLE = "padding:14px 16px;border-bottom:1px solid #e5e7eb;"
+_LAST_ROW_CELL_STYLE = "padding:14px 16px;"
+_ROW_VALUE_STYLE = "font-size:14px;font-weight:600;color:#111111;"
+
+
+# Both formatters return HTML-escaped text, safe to substitute into the templates
+def _format_amount(value, currency_symbol="₦"):
+    try:
+        num = float(value)
+        return f"{currency_symbol}{num:,.2f}"
+    except Exception:
+        return escape(value) if value is not None else "—"
+
+
+def _fmt(val):
+    return escape(val) if val not in (None, "") else "—"
+
+
+def coalesce(*vals):
+    for v in vals:
+        if v not in (None, ""):
+            return v
+    return None
+
+
+_HUMAN_TIME_FORMAT = "%d %b, %Y | %I:%M:%S %p"
+
+
+def _human_time(ts):
+    # Already-parsed datetimes (e.g. the default "now") skip the ISO round-trip
+    if isinstance(ts, datetime):
+        return ts.strftime(_HUMAN_TIME_FORMAT)
+    # Anything else that isn't a string (epoch numbers, dicts, ...) is passed through
+    # unchanged; only strings go to the memoized parser, which needs hashable input
+    if not isinstance(ts, str):
+        return ts
+    return _human_time_from_iso(ts)
+
+
+# Try to pretty-format the created_at if iso format provided.
+# Memoized: alerts fanned out for one event share the same timestamp string.
+@lru_cache(maxsize=1024)
+def _human_time_from_iso(ts: str) -> str:
+    try:
+        # Basic ISO handling; fall back to original on parse errors
+        dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+        return dt.strftime(_HUMAN_TIME_FORMAT)
+    except Exception:
+        return ts
+
+
+def render_debit_alert_html(data: dict) -> str:
+    """Render the Debit Alert email from the mapped notification fields (fallbacks included)."""
+    bank_name = _fmt(data.get("bankName") or "finsync")
+    logo_url = data.get("logoUrl") or _DEFAULT_LOGO_URL
+    # Build brand block (logo if available, else text)
+    if logo_url == _DEFAULT_LOGO_URL and bank_name == _DEFAULT_BANK_NAME:
+        brand_html = _DEFAULT_BRAND_HTML
+    elif logo_url:
+        brand_html = _BRAND_IMG_HTML.format(logo_url=escape(logo_url), bank_name=bank_name)
+    else:
+        brand_html = _FALLBACK_BRAND_HTML
+
+    rows = "".join(
+        _DEBIT_ALERT_ROW_TPL.substitute(cell_style=cell_style, label=label, value_style=value_style, value=value)
+        for label, value, cell_style, value_style in (
+            ("Account Balance", _format_amount(data.get("balance")), _ROW_CELL_STYLE, _ROW_VALUE_STYLE),
+            ("Account Number", _fmt(data.get("accountNumber")), _ROW_CELL_STYLE, _ROW_VALUE_STYLE),
+            ("Date & Time", _fmt(data.get("dateTime")), _ROW_CELL_STYLE, _ROW_VALUE_STYLE),
+            ("Narration", _fmt(data.get("narration")), _ROW_CELL_STYLE, _ROW_VALUE_STYLE + "word-break:break-word;"),
+            ("Reference", _fmt(data.get("reference")), _LAST_ROW_CELL_STYLE, "font-size:13px;color:#333333;word-break:break-all;"),
+        )
+    )
+    header = _DEBIT_ALERT_HEADER_TPL.substitute(
+        brand_html=brand_html,
+        bank_name=bank_name,
+        first_name=_fmt(data.get("firstName") or "Customer"),
+        amount=_format_amount(data.get("amount")),
+    )
+    return header + rows + _DEBIT_ALERT_FOOTER
+
+
+# Email renderer per notification type; other types are skipped before any RTDB read.
+# NEW_ORDER and PASSWORD_RESET have no template of their own yet and keep using the
+# debit alert layout they were always sent with.
+_RENDERERS = {
+    "DEBIT_ALERT": render_debit_alert_html,
+    "NEW_ORDER": render_debit_alert_html,
+    "PASSWORD_RESET": render_debit_alert_html,
+}
+_SUPPORTED_TYPES = frozenset(_RENDERERS)
+
+# Short-lived per-instance cache of user profiles: user_id -> (fetched_at, data).
+# Bursts of alerts for one user then cost a single RTDB read per TTL window.
+# Only stable profile fields are kept; volatile ones like accountBalance are never
+# served from the cache.
+_USER_PROFILE_FIELDS = (
+    "email",
+    "firstName",
+    "name",
+    "accountNumber",
+    "accountNo",
+    "bankName",
+    "logoUrl",
+    "notificationsEnabled",
+)
+_USER_CACHE_TTL_SECONDS = 60
+_USER_CACHE_MAX_ENTRIES = 512
+_USER_CACHE: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+# Gen 2 instances serve concurrent requests on threads; guards every _USER_CACHE access
+_USER_CACHE_LOCK = threading.Lock()
+
+# Marks an accountBalance that wasn't part of this call's read (profile came from cache)
+_BALANCE_NOT_READ = object()
+
+
+def _get_user(user_id: str) -> tuple[dict | None, object]:
+    """Return (profile, accountBalance) for a user.
+
+    On a cache miss the balance comes from the same full-record read; on a cache hit
+    it is `_BALANCE_NOT_READ`, and the caller reads it fresh only if it needs it.
+    """
+    now = time.monotonic()
+    with _USER_CACHE_LOCK:
+        entry = _USER_CACHE.get(user_id)
+        if entry and now - entry[0] < _USER_CACHE_TTL_SECONDS:
+            _USER_CACHE.move_to_end(user_id)
+            return entry[1], _BALANCE_NOT_READ
+
+    # The RTDB read happens outside the lock so concurrent misses don't serialize
+    user_data = users_ref().child(user_id).get()
+    if not user_data:
+        # Don't cache misses; the user record may be written moments later
+        with _USER_CACHE_LOCK:
+            _USER_CACHE.pop(user_id, None)
+        return None, None
+    profile = {k: user_data[k] for k in _USER_PROFILE_FIELDS if k in user_data}
+    with _USER_CACHE_LOCK:
+        _USER_CACHE[user_id] = (now, profile)
+        _USER_CACHE.move_to_end(user_id)
+        while len(_USER_CACHE) > _USER_CACHE_MAX_ENTRIES:
+            _USER_CACHE.popitem(last=False)
+    return profile, user_data.get("accountBalance")
+
+
+def _get_account_balance(user_id: str):
+    # Never served from the profile cache; a stale balance on a debit alert is wrong
+    return users_ref().child(user_id).child("accountBalance").get()
+
+
 @db_fn.on_value_created(
     reference="/notifications/users/{userId}/{notificationId}",
     secrets=[resend_service.RESEND_API_KEY]
@@ -17,7 +242,7 @@ def handle_email_notifications(event: db_fn.Event[dict]) -> None:
 
     Expects notification body at /notifications/users/{userId}/{notificationId} to be:
     {
-        "type": "NEW_ORDER" | "PASSWORD_RESET",
+        "type": "DEBIT_ALERT",       # or NEW_ORDER / PASSWORD_RESET; other types are ignored
         "data": { ... }  # optional, type-specific
     }
     userId is taken from the RTDB path, not the notification body.
@@ -32,15 +257,16 @@ def handle_email_notifications(event: db_fn.Event[dict]) -> None:
         print(f"Error: notification body must be a dict with at least a 'type' field. Got: {notification}")
         return
     notification_type = notification["type"]
+    if notification_type not in _SUPPORTED_TYPES:
+        print(f"Skipping unsupported notification type {notification_type!r}")
+        return
     data = notification.get("data", {})
     user_id = event.params.get("userId")
     if not user_id:
         print(f"Error: userId missing in event.params: {event.params}")
         return
-    # Fetch the user's details from RTDB
-    user_ref = db.reference(f"users/{user_id}")
-    
-    user_data = user_ref.get()
+    # Fetch the user's details from RTDB (cached briefly per warm instance)
+    user_data, account_balance = _get_user(user_id)
     print(f'user_data:{user_data}')
     if not user_data:
         print(f"User {user_id} not found.")
@@ -49,152 +275,36 @@ def handle_email_notifications(event: db_fn.Event[dict]) -> None:
     if not email:
         print(f"[WARN] User {user_id} has no 'email' field. Data: {user_data}")
         return
+    if not user_data.get("notificationsEnabled", True):
+        print(f"User {user_id} has email notifications disabled.")
+        return
 
+    # All preconditions passed; only now build the (comparatively expensive) email
     # Prepare email payload
     # Keep subject from payload if provided; otherwise default
     subject = notification.get("title") or "Debit Alert!"
 
-    # Helper formatters
-    def _format_amount(value, currency_symbol="₦"):
-        try:
-            num = float(value)
-            return f"{currency_symbol}{num:,.2f}"
-        except Exception:
-            return str(value) if value is not None else "—"
-
-    def _fmt(val):
-        return str(val) if val not in (None, "") else "—"
-
-    created_at = notification.get("createdAt") or datetime.utcnow().isoformat(timespec="seconds") + "Z"
     first_name = user_data.get("firstName") or user_data.get("name") or "Customer"
 
-    # Map the repository's notification structure (notifications_db.json) to the debit template fields
-    def coalesce(*vals):
-        for v in vals:
-            if v not in (None, ""):
-                return v
-        return None
-
-    # Try to pretty-format the created_at if iso format provided
-    def _human_time(ts: str) -> str:
-        try:
-            # Basic ISO handling; fall back to original on parse errors
-            dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
-            return dt.strftime("%d %b, %Y | %I:%M:%S %p")
-        except Exception:
-            return ts
-
-    # Debit Alert HTML template (fallbacks included)
-    def render_debit_alert_html(data: dict) -> str:
-        amount = _format_amount(data.get("amount"))
-        balance = _format_amount(data.get("balance"))
-        account_number = _fmt(data.get("accountNumber"))
-        timestamp = _fmt(data.get("dateTime") or created_at)
-        narration = _fmt(data.get("narration"))
-        reference = _fmt(data.get("reference"))
-        bank_name = _fmt(data.get("bankName") or "finsync")
-        logo_url = (
-            data.get("logoUrl")
-            or notification.get("logoUrl")
-            or user_data.get("logoUrl")
-            or os.getenv("FINSYNC_LOGO_URL")
-            or DEFAULT_FINSYNC_LOGO_URL
-        )
-        # Build brand block (logo if available, else text)
-        if logo_url:
-            brand_html = f'<img src="{logo_url}" alt="{bank_name} logo" width="28" height="28" style="display:block;border:0;border-radius:6px;" />'
-        else:
-            brand_html = f'<span style="display:inline-block;width:28px;height:28px;background:#ffffff22;border-radius:6px;"></span>'
+    balance = coalesce(data.get("balance"))
+    if balance is None:
+        if account_balance is _BALANCE_NOT_READ:
+            account_balance = _get_account_balance(user_id)
+        balance = coalesce(account_balance)
 
-        return f"""
-                <div style="margin:0;padding:24px;background:#f5f5f5;font-family:Segoe UI, Roboto, Helvetica, Arial, sans-serif;color:#111111;">
-                    <table role="presentation" width="100%" cellspacing="0" cellpadding="0" border="0" style="max-width:620px;margin:0 auto;background:#ffffff;border-radius:12px;box-shadow:0 1px 3px rgba(0,0,0,0.06);overflow:hidden;">
-                        <tr>
-                            <td style="padding:0;background:linear-gradient(135deg,#111111,#333333);">
-                                                                <table role=\"presentation\" width=\"100%\" cellspacing=\"0\" cellpadding=\"0\" border=\"0\"><tr><td style=\"padding:24px 28px;color:#ffffff;\">
-                                                                        <table role=\"presentation\" width=\"100%\" cellspacing=\"0\" cellpadding=\"0\" border=\"0\"><tr>
-                                                                            <td style=\"font-size:18px;font-weight:600;\">
-                                                                                <table role=\"presentation\" cellspacing=\"0\" cellpadding=\"0\" border=\"0\"><tr>
-                                                                                    <td style=\"vertical-align:middle;\">{brand_html}</td>
-                                                                                    <td style=\"vertical-align:middle;padding-left:10px;text-transform:lowercase;\">{bank_name}</td>
-                                                                                </tr></table>
-                                                                            </td>
-                                                                            <td style=\"text-align:right;font-size:18px;font-weight:700;\">Debit Alert!</td>
-                                                                        </tr></table>
-                                                                </td></tr></table>
-                            </td>
-                        </tr>
-                        <tr>
-                            <td style="padding:28px;">
-                                <p style="margin:0 0 12px 0;font-size:14px;color:#4a5568;">Hi {first_name},</p>
-                                <p style="margin:0 0 18px 0;font-size:14px;color:#4a5568;">We wish to inform you that a transaction occurred on your account with us.</p>
-
-                                <div style="margin:18px 0 22px 0;text-align:center;">
-                                    <div style="font-size:12px;color:#666666;text-transform:uppercase;letter-spacing:0.06em;margin-bottom:6px;">Debit Amount</div>
-                                    <div style="font-size:28px;font-weight:800;color:#111111;">{amount}</div>
-                                </div>
-
-                                                                                                <table role="presentation" width="100%" cellspacing="0" cellpadding="0" border="0" style="border:1px solid #e5e7eb;border-radius:10px;">
-                                                                    <tr>
-                                                                                                        <td style="padding:14px 16px;border-bottom:1px solid #e5e7eb;">
-                                                                            <div style="font-size:11px;color:#8a94a6;text-transform:uppercase;letter-spacing:0.06em;">Account Balance</div>
-                                                                                                            <div style="font-size:14px;font-weight:600;color:#111111;">{balance}</div>
-                                                                        </td>
-                                                                    </tr>
-                                                                    <tr>
-                                                                                                        <td style="padding:14px 16px;border-bottom:1px solid #e5e7eb;">
-                                                                            <div style="font-size:11px;color:#8a94a6;text-transform:uppercase;letter-spacing:0.06em;">Account Number</div>
-                                                                                                            <div style="font-size:14px;font-weight:600;color:#111111;">{account_number}</div>
-                                                                        </td>
-                                                                    </tr>
-                                                                    <tr>
-                                                                                                        <td style="padding:14px 16px;border-bottom:1px solid #e5e7eb;">
-                                                                            <div style="font-size:11px;color:#8a94a6;text-transform:uppercase;letter-spacing:0.06em;">Date & Time</div>
-                                                                                                            <div style="font-size:14px;font-weight:600;color:#111111;">{timestamp}</div>
-                                                                        </td>
-                                                                    </tr>
-                                                                    <tr>
-                                                                                                        <td style="padding:14px 16px;border-bottom:1px solid #e5e7eb;">
-                                                                            <div style="font-size:11px;color:#8a94a6;text-transform:uppercase;letter-spacing:0.06em;">Narration</div>
-                                                                                                            <div style="font-size:14px;font-weight:600;color:#111111;word-break:break-word;">{narration}</div>
-                                                                        </td>
-                                                                    </tr>
-                                                                    <tr>
-                                                                        <td style="padding:14px 16px;">
-                                                                            <div style="font-size:11px;color:#8a94a6;text-transform:uppercase;letter-spacing:0.06em;">Reference</div>
-                                                                                                            <div style="font-size:13px;color:#333333;word-break:break-all;">{reference}</div>
-                                                                        </td>
-                                                                    </tr>
-                                                                </table>
-
-                                <p style="margin:18px 0 0 0;font-size:12px;color:#6b7280;">If you experience any problems kindly contact us at <a href="mailto:support@finsyncdigitalservice.com" style="color:#111111;text-decoration:none;">support@finsyncdigitalservice.com</a> or send a WhatsApp message at <a style=\"color:#111111;text-decoration:none;\" href=\"https://wa.me/2348068810033\">+234 806 881 0033</a>.</p>
-                            </td>
-                        </tr>
-                        <tr>
-                            <td style="padding:18px 28px;background:#f8fafc;color:#64748b;font-size:11px;text-align:center;">
-                                <div style="margin-bottom:6px;">Follow us on</div>
-                                <div>
-                                    <a href="https://twitter.com" style="color:#111111;text-decoration:none;margin:0 6px;">Twitter</a>
-                                    <a href="https://facebook.com" style="color:#111111;text-decoration:none;margin:0 6px;">Facebook</a>
-                                    <a href="https://instagram.com" style="color:#111111;text-decoration:none;margin:0 6px;">Instagram</a>
-                                </div>
-                            </td>
-                        </tr>
-                    </table>
-                </div>
-        """
-
-    # Always map and render the Debit Alert template (no condition by type/flow)
+    # Map the repository's notification structure (notifications_db.json) to the debit template fields
     mapped = {
         "amount": coalesce(data.get("amount")),
-        "balance": coalesce(data.get("balance"), user_data.get("accountBalance")),
+        "balance": balance,
         "accountNumber": coalesce(user_data.get("accountNumber"), user_data.get("accountNo")),
-        "dateTime": _human_time(coalesce(notification.get("createdAt"), data.get("dateTime"), created_at)),
+        "dateTime": _human_time(coalesce(notification.get("createdAt"), data.get("dateTime")) or datetime.now(timezone.utc)),
         "narration": coalesce(data.get("description"), notification.get("body")),
         "reference": coalesce(data.get("transactionId"), data.get("reference"), notification.get("id")),
-        "bankName": coalesce(user_data.get("bankName"), "Finsync"),
+        "bankName": coalesce(user_data.get("bankName"), _DEFAULT_BANK_NAME),
+        "firstName": first_name,
+        "logoUrl": coalesce(data.get("logoUrl"), notification.get("logoUrl"), user_data.get("logoUrl")),
     }
-    html = render_debit_alert_html(mapped)
+    html = _RENDERERS[notification_type](mapped)
     params = {
         "from": "Finsync <alerts@finsyncdigitalservice.com>",
         "to": [email],
@@ -204,12 +314,15 @@ def handle_email_notifications(event: db_fn.Event[dict]) -> None:
 
     # Send the email via Resend
     try:
-        resend_service.send_email(
+        result = resend_service.send_email(
             from_addr=params["from"],
             to=params["to"],
             subject=params["subject"],
             html=params["html"],
         )
+        if not result:
+            print(f"Failed to send '{notification_type}' email to {user_data['email']} via Resend.")
+            return
         print(f"Sent '{notification_type}' email to {user_data['email']}")
     except Exception as e:
         print(f"Error sending email via Resend: {e}")
\ No newline at end of file
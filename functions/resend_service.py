@@ -1,5 +1,7 @@
 
 import os
+import threading
+import requests
 import resend
 from firebase_functions.params import SecretParam
 
@@ -14,6 +16,49 @@ RESEND_API_KEY = SecretParam('RESEND_API_KEY')
 # In-memory cache (persists for warm function instances)
 _CACHED_API_KEY: str | None = None
 _RESEND_INITIALIZED = False
+_INIT_LOCK = threading.Lock()
+
+_RESEND_API_BASE = "https://api.resend.com"
+
+# Shared keep-alive session: warm instances reuse the TCP/TLS connection to Resend
+_SESSION = requests.Session()
+_SESSION.headers["Connection"] = "keep-alive"
+
+
+try:
+    from resend.http_client import HTTPClient as _HTTPClient
+except ImportError:  # SDK versions without a pluggable HTTP client
+    _HTTPClient = None
+
+
+if _HTTPClient is not None:
+    class _SessionHTTPClient(_HTTPClient):
+        """Resend SDK HTTP client that sends every request through the shared `_SESSION`.
+
+        Mirrors the SDK's default `RequestsClient.request`, including multipart
+        `files`/`data` uploads.
+        """
+
+        def __init__(self, timeout: int = 30):
+            self._timeout = timeout
+
+        def request(self, method, url, headers, json=None, files=None, data=None):
+            try:
+                resp = _SESSION.request(
+                    method=method,
+                    url=url,
+                    headers=headers,
+                    json=json,
+                    files=files,
+                    data=data,
+                    timeout=self._timeout,
+                )
+            except requests.RequestException as e:
+                raise RuntimeError(f"Request failed: {e}") from e
+            return resp.content, resp.status_code, resp.headers
+
+    resend.default_http_client = _SessionHTTPClient()
+
 
 def _mask(value: str, show: int = 6) -> str:
     if not value:
@@ -35,17 +80,38 @@ def get_resend_api_key():
     return os.getenv('RESEND_API_KEY')
 
 
+def _prewarm_connection():
+    # Open the pooled connection (DNS + TCP + TLS) before the first real send
+    try:
+        _SESSION.head(_RESEND_API_BASE, timeout=2)
+    except Exception as e:
+        print(f"[DEBUG] Resend prewarm skipped: {e}")
+
+
 def _ensure_resend_initialized():
     global _CACHED_API_KEY, _RESEND_INITIALIZED
     if _RESEND_INITIALIZED and _CACHED_API_KEY:
         return
-    key = get_resend_api_key()
-    if not key:
-        raise ValueError("RESEND_API_KEY is missing. Attach it via run_with.secrets or set env var.")
-    _CACHED_API_KEY = key
-    resend.api_key = key
-    _RESEND_INITIALIZED = True
+    # The background warm-up thread and the first send may race to get here
+    with _INIT_LOCK:
+        if _RESEND_INITIALIZED and _CACHED_API_KEY:
+            return
+        key = get_resend_api_key()
+        if not key:
+            raise ValueError("RESEND_API_KEY is missing. Attach it via run_with.secrets or set env var.")
+        _CACHED_API_KEY = key
+        resend.api_key = key
+        _RESEND_INITIALIZED = True
     print(f"[DEBUG] Resend initialized with API key: {_mask(key)}")
+    threading.Thread(target=_prewarm_connection, daemon=True).start()
+
+
+def _background_initialize():
+    try:
+        _ensure_resend_initialized()
+    except Exception as e:
+        # Non-fatal: send_email initializes synchronously and raises if the key is still missing
+        print(f"[DEBUG] Resend background initialization skipped: {e}")
 
 def send_email(
     from_addr,
@@ -79,3 +145,49 @@ def send_email(
     except Exception as e:
         print(f"[ERROR] Failed to send email: {e}")
         return None
+
+
+# Resend accepts at most 100 emails per batch request
+_BATCH_LIMIT = 100
+
+
+class BatchSendError(Exception):
+    """A batch request failed; `messages[:sent_count]` were already sent (see `results`)."""
+
+    def __init__(self, sent_count, results, cause):
+        super().__init__(f"batch send failed after {sent_count} email(s) were sent: {cause}")
+        self.sent_count = sent_count
+        self.results = results
+
+
+def send_email_batch(messages):
+    """Send many emails using Resend batch requests instead of one call per email.
+
+    `messages` is a list of dicts shaped like the `send_email` params
+    ("from", "to", "subject", "html", and optionally "reply_to", ...).
+    Raises `BatchSendError` if a request fails, so callers never mistake a
+    partial send for a complete one (and retry into duplicates).
+    """
+    _ensure_resend_initialized()
+    results = []
+    for start in range(0, len(messages), _BATCH_LIMIT):
+        try:
+            results.append(resend.Batch.send(messages[start:start + _BATCH_LIMIT]))
+        except Exception as e:
+            print(f"[ERROR] Failed to send email batch at message {start}: {e}")
+            raise BatchSendError(start, results, e) from e
+    print(f"[DEBUG] Email batch sent: {results}")
+    return results
+
+
+# Resolve the secret and warm the Resend connection while the instance boots, so the
+# first send doesn't pay for it. Only functions with RESEND_API_KEY bound get it as an
+# env var, so instances that never send email (e.g. the verification click) skip it.
+# Also skipped during the Firebase CLI's deploy-time function discovery (the Python SDK
+# serves it when ADMIN_PORT is set), where network calls are unwanted.
+if (
+    os.getenv("RESEND_API_KEY")
+    and not os.getenv("ADMIN_PORT")
+    and os.getenv("FUNCTIONS_CONTROL_API") != "true"
+):
+    threading.Thread(target=_background_initialize, daemon=True).start()
@@ -0,0 +1,36 @@
+"""Memoized Realtime Database references shared by the handlers.
+
+Building a `db.Reference` parses its path on every call; the handlers always start
+from the same few nodes, so those are created once per warm instance and descended
+with `.child(...)`. `firebase_admin.db` is imported on first use to keep it out of
+the cold-start import graph.
+"""
+
+_root_ref = None
+_users_ref = None
+_verification_tokens_ref = None
+
+
+def root_ref():
+    """Reference to the database root, used for multi-path updates."""
+    global _root_ref
+    if _root_ref is None:
+        from firebase_admin import db
+        _root_ref = db.reference("/")
+    return _root_ref
+
+
+def users_ref():
+    """Reference to `/users`."""
+    global _users_ref
+    if _users_ref is None:
+        _users_ref = root_ref().child("users")
+    return _users_ref
+
+
+def verification_tokens_ref():
+    """Reference to `/verificationTokens` (token -> {userId, expires})."""
+    global _verification_tokens_ref
+    if _verification_tokens_ref is None:
+        _verification_tokens_ref = root_ref().child("verificationTokens")
+    return _verification_tokens_ref
@@ -1,24 +1,111 @@
 import os
+import re
 import secrets
-from datetime import datetime, timedelta, timezone
-from flask import redirect, Response
-import firebase_admin
-from firebase_admin import db
-from firebase_functions import db_fn
-from firebase_functions.https_fn import on_request, Request
+import time
+from types import MappingProxyType
+from firebase_functions import db_fn, scheduler_fn
+from firebase_functions.https_fn import on_request, Request, Response
 import resend_service  # Import from the local resend_service.py file
+from rtdb import root_ref, users_ref, verification_tokens_ref
 
 # Default base URL for production — set to the direct Cloud Run URL of the function
 # Example provided: https://handle-verification-click-5czh4imcxq-uc.a.run.app
 DEFAULT_FUNCTION_BASE_URL = "https://handle-verification-click-5czh4imcxq-uc.a.run.app"
 
+
+def _verification_url_prefix() -> str:
+    # Build verification URL using a simple, configurable base with a safe default
+    base_url = os.getenv("FUNCTION_BASE_URL") or os.getenv("VERIFICATION_BASE_URL") or DEFAULT_FUNCTION_BASE_URL
+    function_path = "handle_verification_click"
+    base_clean = base_url.rstrip("/")
+    base_lower = base_clean.lower()
+    # If base already points directly to the function (e.g., run.app) or ends with the function name, don't append it again
+    if base_lower.endswith(f"/{function_path}") or "run.app" in base_lower:
+        return base_clean
+    return f"{base_clean}/{function_path}"
+
+
+# Verification links all share this prefix; only the token differs
+_VERIFICATION_URL_PREFIX = _verification_url_prefix()
+
+# Verification links stay valid for one hour
+TOKEN_TTL_SECONDS = 3600
+# Used links keep answering repeat clicks with the success page for a day
+USED_TOKEN_TTL_SECONDS = 24 * 3600
+
+# Tokens are secrets.token_urlsafe(_TOKEN_BYTES): 24 random bytes -> 32 base64url chars.
+# Anything else is rejected before touching RTDB.
+_TOKEN_BYTES = 24
+_TOKEN_RE = re.compile(r"[A-Za-z0-9_-]{32}")
+
+# Verification email body; only the link is filled in per user
+_VERIFICATION_EMAIL_HTML = """
+            <h1>Welcome to Our App!</h1>
+            <p>Click the link below to verify your email. It expires in 1 hour.</p>
+            <a href="{url}"><strong>Verify My Email</strong></a>
+        """
+
+# Shared read-only default for users without a nested profile
+_EMPTY_PROFILE = MappingProxyType({})
+
+# Static success page, encoded once at import and served as-is on every verification
+_SUCCESS_HTML = """<!doctype html>
+<html lang="en">
+<head>
+  <meta charset="utf-8">
+  <meta name="viewport" content="width=device-width, initial-scale=1">
+  <title>Email Verified</title>
+  <style>
+    :root{color-scheme: light dark;}
+    body{font-family: system-ui, -apple-system, Segoe UI, Roboto, Arial, sans-serif;
+         margin:0;display:flex;align-items:center;justify-content:center;min-height:100vh;
+         background: radial-gradient(1200px circle at 10% 10%, #f0f7ff, transparent),
+                     radial-gradient(1200px circle at 90% 90%, #f6fff0, transparent);}
+    .card{max-width:560px;background:rgba(255,255,255,0.9);backdrop-filter: blur(6px);
+          border:1px solid rgba(0,0,0,0.06);border-radius:16px;padding:32px;
+          box-shadow: 0 10px 30px rgba(0,0,0,0.08);}
+    h1{font-size:1.75rem;margin:0 0 8px;}
+    p{margin:8px 0 0;line-height:1.55;}
+    .ok{display:inline-flex;align-items:center;justify-content:center;
+        width:44px;height:44px;border-radius:999px;background:#22c55e;color:#fff;
+        box-shadow: 0 6px 16px rgba(34,197,94,0.35);margin-bottom:12px;}
+    .muted{color:#666}
+    a.btn{display:inline-block;margin-top:16px;padding:10px 14px;border-radius:10px;
+          text-decoration:none;background:#2563eb;color:#fff;}
+    a.btn:hover{background:#1d4ed8}
+  </style>
+</head>
+<body>
+  <main class="card">
+    <div class="ok">✔</div>
+    <h1>Your email is verified</h1>
+    <p>Thanks for confirming your email. Your account is now fully activated.</p>
+    <p class="muted">You can safely close this tab or return to the app.</p>
+  </main>
+</body>
+</html>
+"""
+_SUCCESS_HTML_BYTES = _SUCCESS_HTML.encode("utf-8")
+_SUCCESS_HEADERS = {"Content-Type": "text/html; charset=utf-8"}
+
+# Optional static success page (e.g. on Firebase Hosting). When set, successful clicks get a
+# 302 to it so the CDN serves the page; otherwise the inline page above is returned.
+VERIFIED_REDIRECT_URL = os.getenv("VERIFIED_REDIRECT_URL")
+
+
+def _success_response() -> Response:
+    if VERIFIED_REDIRECT_URL:
+        # Deferred: only needed when a redirect target is configured
+        from flask import redirect
+        return redirect(VERIFIED_REDIRECT_URL, code=302)
+    return Response(_SUCCESS_HTML_BYTES, status=200, headers=_SUCCESS_HEADERS)
+
 @db_fn.on_value_created(
     reference="/users/{userId}",
     secrets=[resend_service.RESEND_API_KEY]
 )
 def send_verification_email(event: db_fn.Event[dict]) -> None:
     """Triggers when a new user is created in RTDB and sends a verification email."""
-   
     # Get user data from the event
     user_data = event.data
     user_id = event.params["userId"]
@@ -27,42 +114,30 @@ def send_verification_email(event: db_fn.Event[dict]) -> None:
         print(f"User {user_id} already verified or data is missing.")
         return
 
-    # Generate a secure token
-    token = secrets.token_hex(32)
-    expires = datetime.now(timezone.utc) + timedelta(hours=1)
-    
-    # Update the user's record in RTDB with the token under a nested key
-    user_ref = db.reference(f"/users/{user_id}")
-    user_ref.child("verification").update({
-        "token": token,
-        "expires": expires.isoformat(),
-    })
-
-    # Build verification URL using a simple, configurable base with a safe default
-    base_url = os.getenv("FUNCTION_BASE_URL") or os.getenv("VERIFICATION_BASE_URL") or DEFAULT_FUNCTION_BASE_URL
-    function_path = "handle_verification_click"
-    base_clean = base_url.rstrip("/")
-    # If base already points directly to the function (e.g., run.app) or ends with the function name, don't append it again
-    if base_clean.lower().endswith(f"/{function_path}") or ("run.app" in base_clean.lower()):
-        verification_url = f"{base_clean}?token={token}"
-    else:
-        verification_url = f"{base_clean}/{function_path}?token={token}"
-    # Try common locations for email (flat or nested under profile)
-    email = user_data.get("email") or user_data.get("profile", {}).get("email")
+    # Try common locations for email (flat or nested under profile); checked before any
+    # token generation or RTDB write so records without an email cost nothing
+    email = user_data.get("email") or user_data.get("profile", _EMPTY_PROFILE).get("email")
     if not email:
         print(f"[WARN] User {user_id} has no 'email' field. Data: {user_data}")
         return
-    
+
+    # Generate a secure token
+    token = secrets.token_urlsafe(_TOKEN_BYTES)  # 192 bits, URL-safe and valid as an RTDB key
+
+    # Store the token keyed by itself so the click handler resolves it with one keyed read
+    verification_tokens_ref().child(token).set({
+        "userId": user_id,
+        "expires": int(time.time()) + TOKEN_TTL_SECONDS,  # Unix epoch seconds
+    })
+
+    verification_url = f"{_VERIFICATION_URL_PREFIX}?token={token}"
+
     # Send email using resend_service.send_email
     params = {
         "from": "Onboarding <onboarding@finsyncdigitalservice.com>",
     "to": [email],
         "subject": "Welcome! Please Verify Your Email",
-        "html": f"""
-            <h1>Welcome to Our App!</h1>
-            <p>Click the link below to verify your email. It expires in 1 hour.</p>
-            <a href=\"{verification_url}\"><strong>Verify My Email</strong></a>
-        """,
+        "html": _VERIFICATION_EMAIL_HTML.format(url=verification_url),
     }
     result = resend_service.send_email(
         from_addr=params["from"],
@@ -78,81 +153,116 @@ def send_verification_email(event: db_fn.Event[dict]) -> None:
 @on_request()
 def handle_verification_click(req: Request) -> Response:
     """Handles the verification link clicked by the user."""
-    
+    return handle_verification_click_impl(req)
+
+
+def handle_verification_click_impl(req: Request) -> Response:
+    """Verifies the token in `req`; served by `handle_verification_click` and the multiplexed `api`."""
     token = req.args.get("token")
     if not token:
         return "Invalid request: Token is missing.", 400
+    if not _TOKEN_RE.fullmatch(token):
+        return "Invalid request: Malformed token.", 400
 
-    # Query RTDB to find the user with the matching token
-    users_ref = db.reference("users")
-    # Query by nested verification token
-    results = users_ref.order_by_child("verification/token").equal_to(token).limit_to_first(1).get()
+    # Resolve the token through the reverse index (one keyed read, no query over users)
+    token_ref = verification_tokens_ref().child(token)
+    entry = token_ref.get()
 
-    if not results:
+    if not entry:
+        return "Invalid or expired verification link.", 404
+    # Repeat click on an already-used link: same success outcome, no writes
+    if entry.get("used"):
+        return _success_response()
+    if not entry.get("userId"):
         return "Invalid or expired verification link.", 404
 
-    # Extract user ID and data from the query results
-    user_id, user_data = next(iter(results.items()))
+    user_id = entry["userId"]
 
-    # Check if the token has expired
-    verification = user_data.get("verification", {})
-    expires_str = verification.get("expires")
-    if not expires_str:
+    # Check if the token has expired (plain epoch-seconds comparison)
+    expires = entry.get("expires")
+    if not isinstance(expires, (int, float)):
         return "Invalid or expired verification link.", 404
-    expires = datetime.fromisoformat(expires_str)
-    if datetime.now(timezone.utc) > expires:
+    if time.time() > expires:
         return "Verification link has expired.", 400
 
-    # Update user record to mark as verified
-    user_ref = db.reference(f"users/{user_id}")
-    user_ref.update({
-        "isVerified": True,
-    })
-    # Clear nested verification fields
-    user_ref.child("verification").update({
-        "token": None,
-        "expires": None,
+    # Mark the user as verified and replace the token with a short-lived "used" marker in
+    # a single atomic multi-path update; also drops any `users/{userId}/verification`
+    # left by older deployments. The sweeper removes the marker once it expires.
+    root_ref().update({
+        f"users/{user_id}/isVerified": True,
+        f"users/{user_id}/verification": None,
+        f"verificationTokens/{token}": {"used": True, "expires": int(time.time()) + USED_TOKEN_TTL_SECONDS},
     })
 
     print(f"User {user_id} successfully verified.")
 
-    # Return a simple HTML success page
-    success_html = (
-        "<!doctype html>\n"
-        "<html lang=\"en\">\n"
-        "<head>\n"
-        "  <meta charset=\"utf-8\">\n"
-        "  <meta name=\"viewport\" content=\"width=device-width, initial-scale=1\">\n"
-        "  <title>Email Verified</title>\n"
-        "  <style>\n"
-        "    :root{color-scheme: light dark;}\n"
-        "    body{font-family: system-ui, -apple-system, Segoe UI, Roboto, Arial, sans-serif;\n"
-        "         margin:0;display:flex;align-items:center;justify-content:center;min-height:100vh;\n"
-        "         background: radial-gradient(1200px circle at 10% 10%, #f0f7ff, transparent),\n"
-        "                     radial-gradient(1200px circle at 90% 90%, #f6fff0, transparent);}\n"
-        "    .card{max-width:560px;background:rgba(255,255,255,0.9);backdrop-filter: blur(6px);\n"
-        "          border:1px solid rgba(0,0,0,0.06);border-radius:16px;padding:32px;\n"
-        "          box-shadow: 0 10px 30px rgba(0,0,0,0.08);}\n"
-        "    h1{font-size:1.75rem;margin:0 0 8px;}\n"
-        "    p{margin:8px 0 0;line-height:1.55;}\n"
-        "    .ok{display:inline-flex;align-items:center;justify-content:center;\n"
-        "        width:44px;height:44px;border-radius:999px;background:#22c55e;color:#fff;\n"
-        "        box-shadow: 0 6px 16px rgba(34,197,94,0.35);margin-bottom:12px;}\n"
-        "    .muted{color:#666}\n"
-        "    a.btn{display:inline-block;margin-top:16px;padding:10px 14px;border-radius:10px;\n"
-        "          text-decoration:none;background:#2563eb;color:#fff;}\n"
-        "    a.btn:hover{background:#1d4ed8}\n"
-        "  </style>\n"
-        "</head>\n"
-        "<body>\n"
-        "  <main class=\"card\">\n"
-        "    <div class=\"ok\">✔</div>\n"
-        "    <h1>Your email is verified</h1>\n"
-        "    <p>Thanks for confirming your email. Your account is now fully activated.</p>\n"
-        "    <p class=\"muted\">You can safely close this tab or return to the app.</p>\n"
-        "  </main>\n"
-        "</body>\n"
-        "</html>\n"
-    )
+    return _success_response()
+
+
+# Set once the one-off purge of pre-/verificationTokens `users/{uid}/verification` subtrees
+# has finished, so later sweeps skip it with a single keyed read
+_LEGACY_PURGE_DONE_PATH = "migrations/legacyUserVerificationPurged"
+_LEGACY_PURGE_PAGE_SIZE = 500
+
+
+def _purge_legacy_user_verification() -> int:
+    """Removes every `users/{uid}/verification` subtree left by older deployments.
+
+    Those tokens are no longer honored by the click handler, so unclicked ones would stay
+    forever. Users are scanned once in key-ordered pages (no index needed); returns the
+    number of subtrees removed.
+    """
+    done_ref = root_ref().child(_LEGACY_PURGE_DONE_PATH)
+    if done_ref.get():
+        return 0
 
-    return success_html, 200, {"Content-Type": "text/html; charset=utf-8"}
\ No newline at end of file
+    removed = 0
+    last_key = None
+    while True:
+        query = users_ref().order_by_key()
+        if last_key is None:
+            page = query.limit_to_first(_LEGACY_PURGE_PAGE_SIZE).get() or {}
+        else:
+            # start_at is inclusive: fetch one extra and drop the key already seen
+            page = query.start_at(last_key).limit_to_first(_LEGACY_PURGE_PAGE_SIZE + 1).get() or {}
+            page.pop(last_key, None)
+        if not page:
+            break
+        stale = {
+            f"users/{user_id}/verification": None
+            for user_id, user_data in page.items()
+            if isinstance(user_data, dict) and "verification" in user_data
+        }
+        if stale:
+            root_ref().update(stale)
+            removed += len(stale)
+        last_key = next(reversed(page))
+
+    done_ref.set(True)
+    return removed
+
+
+@scheduler_fn.on_schedule(schedule="every 6 hours")
+def sweep_expired_verification_tokens(event: scheduler_fn.ScheduledEvent) -> None:
+    """Deletes expired entries from /verificationTokens so the node only holds live links.
+
+    The first run also purges the legacy `users/{uid}/verification` subtrees.
+    """
+    legacy_removed = _purge_legacy_user_verification()
+    if legacy_removed:
+        print(f"Removed {legacy_removed} legacy users/*/verification subtree(s).")
+
+    now = time.time()
+    # The node only ever holds tokens and used markers from about the last day, so reading
+    # it whole is cheap and avoids depending on an `.indexOn: ["expires"]` database rule
+    entries = verification_tokens_ref().get() or {}
+    expired = {
+        token: None
+        for token, entry in entries.items()
+        if not isinstance(entry, dict)
+        or not isinstance(entry.get("expires"), (int, float))
+        or entry["expires"] < now
+    }
+    if expired:
+        verification_tokens_ref().update(expired)
+    print(f"Removed {len(expired)} expired verification token(s).")